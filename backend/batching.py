@@ -0,0 +1,115 @@
+"""
+Dynamic micro-batching for Gemini calls.
+Requests arriving within a short window are sent to the model as one prompt.
+"""
+
+import asyncio
+from typing import Awaitable, Callable, Generic, Hashable, TypeVar
+
+T = TypeVar("T")
+
+# Runs one model call for a group of prompts, returning one response per prompt
+BatchRunner = Callable[[Hashable, list[str]], Awaitable[list[T]]]
+
+
+class BatchQueue(Generic[T]):
+    """
+    Runs prompts that arrive together as one batch (up to `max_batch_size`).
+    A prompt that finds the queue empty is sent at once; when others are
+    already waiting, the batch keeps collecting for `window` seconds. Only prompts sharing a group key are batched, so
+    every batch can use a single response schema and config. Prompts in one
+    batch are visible to each other inside the model call, so the group key
+    must also separate anything that has to stay isolated (e.g. user sessions).
+    """
+
+    def __init__(self, run_batch: BatchRunner[T], window: float = 0.05, max_batch_size: int = 8):
+        self.run_batch = run_batch
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self._queue: asyncio.Queue[tuple[Hashable, str, asyncio.Future[T]]] | None = None
+        self._worker: asyncio.Task | None = None
+        self._dispatches: set[asyncio.Task] = set()
+
+    def start(self) -> None:
+        """Start the worker on the running event loop."""
+        self._queue = asyncio.Queue()
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the worker and cancel every prompt still queued or waiting on the model."""
+        if self._worker is None:
+            return
+        self._worker.cancel()
+        for task in list(self._dispatches):
+            task.cancel()
+        await asyncio.gather(self._worker, *self._dispatches, return_exceptions=True)
+        while not self._queue.empty():
+            _, _, future = self._queue.get_nowait()
+            future.cancel()
+        self._worker = None
+        self._queue = None
+
+    async def submit(self, prompt: str, group: Hashable = None) -> T:
+        """Queue a prompt and wait for its share of the batched response."""
+        if self._worker is None:
+            # Not running under the server lifespan (e.g. scripts) - call directly
+            return (await self.run_batch(group, [prompt]))[0]
+
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((group, prompt, future))
+        return await future
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        batch: list[tuple[Hashable, str, asyncio.Future[T]]] = []
+        try:
+            while True:
+                batch = [await self._queue.get()]
+                while len(batch) < self.max_batch_size and not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+
+                # Only wait out the window when there is already something to batch with;
+                # a lone prompt is sent straight away
+                if len(batch) > 1:
+                    deadline = loop.time() + self.window
+                    while len(batch) < self.max_batch_size:
+                        remaining = deadline - loop.time()
+                        if remaining <= 0:
+                            break
+                        try:
+                            batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                        except asyncio.TimeoutError:
+                            break
+
+                groups: dict[Hashable, list[tuple[str, asyncio.Future[T]]]] = {}
+                for group, prompt, future in batch:
+                    if not future.done():  # Caller may have gone away while queued
+                        groups.setdefault(group, []).append((prompt, future))
+                batch = []
+
+                for group, items in groups.items():
+                    task = asyncio.create_task(self._dispatch(group, items))
+                    self._dispatches.add(task)
+                    task.add_done_callback(self._dispatches.discard)
+        except asyncio.CancelledError:
+            # Prompts taken off the queue but not yet dispatched
+            for _, _, future in batch:
+                future.cancel()
+            raise
+
+    async def _dispatch(self, group: Hashable, items: list[tuple[str, asyncio.Future[T]]]) -> None:
+        try:
+            responses = await self.run_batch(group, [prompt for prompt, _ in items])
+        except asyncio.CancelledError:
+            for _, future in items:
+                future.cancel()
+            raise
+        except Exception as e:
+            for _, future in items:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), response in zip(items, responses):
+            if not future.done():
+                future.set_result(response)
@@ -3,18 +3,42 @@ FastAPI server for the Ecosystem Simulator.
 Provides REST endpoints for the frontend.
 """
 
-from fastapi import FastAPI, HTTPException
+import json
+import asyncio
+import weakref
+from contextlib import asynccontextmanager
+
+from cachetools import TTLCache
+from fastapi import FastAPI, HTTPException, Depends, Header, Cookie
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel
 from typing import Optional
 
-from schemas import EcosystemState, SimulationResult, UserIntervention
-from simulation import create_initial_ecosystem, advance_simulation, chat_about_ecosystem
+from schemas import EcosystemState, SimulationResult, ThinkingLevel, UserIntervention
+from simulation import (
+    create_initial_ecosystem,
+    advance_simulation,
+    chat_about_ecosystem,
+    stream_advance_simulation,
+    stream_chat_about_ecosystem,
+    chat_queue,
+)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # The chat batch worker lives on the server's event loop
+    chat_queue.start()
+    yield
+    await chat_queue.stop()
+
 
 app = FastAPI(
     title="Ecosystem Simulator",
     description="AI-powered ecosystem simulation using Gemini 3",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
 )
 
 # Allow frontend to connect
@@ -26,8 +50,45 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# In-memory state (simple for hackathon - no persistence needed)
-current_ecosystem: EcosystemState | None = None
+SESSION_LIMIT = 1000  # Least recently used sessions are dropped beyond this
+SESSION_TTL = 6 * 60 * 60  # Seconds a session survives without a new turn
+
+# In-memory state per session (simple for hackathon - no persistence needed)
+sessions: TTLCache[str, EcosystemState] = TTLCache(maxsize=SESSION_LIMIT, ttl=SESSION_TTL)
+# Serializes turns within a session; different sessions run in parallel.
+# Weak values drop a lock once no request holds or waits on it, so locks
+# never outlive their sessions.
+session_locks: weakref.WeakValueDictionary[str, asyncio.Lock] = weakref.WeakValueDictionary()
+
+
+def session_lock(session_id: str) -> asyncio.Lock:
+    lock = session_locks.get(session_id)
+    if lock is None:
+        lock = session_locks[session_id] = asyncio.Lock()
+    return lock
+
+
+def get_session_id(
+    x_session_id: Optional[str] = Header(default=None),
+    session_id: Optional[str] = Cookie(default=None),
+) -> str:
+    """Session from the X-Session-ID header or session_id cookie; clients sending neither share one."""
+    return x_session_id or session_id or "default"
+
+
+def model_response(model: BaseModel) -> Response:
+    """
+    Serialize a model straight to JSON bytes in pydantic-core, skipping
+    FastAPI's response-model validation and encoder walk for large states.
+    """
+    return Response(content=model.model_dump_json(), media_type="application/json")
+
+
+def require_ecosystem(session_id: str) -> EcosystemState:
+    state = sessions.get(session_id)
+    if state is None:
+        raise HTTPException(status_code=404, detail="No ecosystem exists. Create one first.")
+    return state
 
 
 class ChatRequest(BaseModel):
@@ -41,6 +102,7 @@ class ChatResponse(BaseModel):
 class InterventionRequest(BaseModel):
     action: str
     details: Optional[str] = None
+    thinking_level: Optional[ThinkingLevel] = None
 
 
 @app.get("/")
@@ -49,72 +111,120 @@ async def root():
 
 
 @app.post("/ecosystem/new", response_model=EcosystemState)
-async def create_new_ecosystem(grid_size: int = 8):
+async def create_new_ecosystem(grid_size: int = 8, session_id: str = Depends(get_session_id)):
     """Create a fresh ecosystem."""
-    global current_ecosystem
-    current_ecosystem = create_initial_ecosystem(grid_size)
-    return current_ecosystem
+    async with session_lock(session_id):
+        sessions[session_id] = create_initial_ecosystem(grid_size)
+        return model_response(sessions[session_id])
 
 
 @app.get("/ecosystem", response_model=EcosystemState)
-async def get_ecosystem():
+async def get_ecosystem(session_id: str = Depends(get_session_id)):
     """Get the current ecosystem state."""
-    if current_ecosystem is None:
-        raise HTTPException(status_code=404, detail="No ecosystem exists. Create one first.")
-    return current_ecosystem
+    return model_response(require_ecosystem(session_id))
 
 
 @app.post("/ecosystem/advance", response_model=SimulationResult)
-async def advance_turn(intervention: Optional[InterventionRequest] = None):
+async def advance_turn(
+    intervention: Optional[InterventionRequest] = None,
+    session_id: str = Depends(get_session_id),
+):
     """Advance the simulation by one turn, optionally with a user intervention."""
-    global current_ecosystem
+    user_intervention = None
+    if intervention:
+        user_intervention = UserIntervention(
+            action=intervention.action,
+            details=intervention.details,
+            thinking_level=intervention.thinking_level
+        )
+
+    async with session_lock(session_id):
+        result = await advance_simulation(require_ecosystem(session_id), user_intervention)
+        sessions[session_id] = result.new_state
+
+    return model_response(result)
 
-    if current_ecosystem is None:
-        raise HTTPException(status_code=404, detail="No ecosystem exists. Create one first.")
+
+@app.post("/ecosystem/advance/stream")
+async def advance_turn_stream(
+    intervention: Optional[InterventionRequest] = None,
+    session_id: str = Depends(get_session_id),
+):
+    """
+    Advance the simulation by one turn as server-sent events.
+    Sends `narration` events while Gemini writes, then a `result` event
+    with the full SimulationResult (or an `error` event).
+    """
+    require_ecosystem(session_id)
 
     user_intervention = None
     if intervention:
         user_intervention = UserIntervention(
             action=intervention.action,
-            details=intervention.details
+            details=intervention.details,
+            thinking_level=intervention.thinking_level
         )
 
-    result = await advance_simulation(current_ecosystem, user_intervention)
-    current_ecosystem = result.new_state
+    async def events():
+        async with session_lock(session_id):
+            try:
+                state = require_ecosystem(session_id)
+                async for item in stream_advance_simulation(state, user_intervention):
+                    if isinstance(item, SimulationResult):
+                        sessions[session_id] = item.new_state
+                        yield f"event: result\ndata: {item.model_dump_json()}\n\n"
+                    else:
+                        yield f"event: narration\ndata: {json.dumps(item)}\n\n"
+            except HTTPException as e:
+                yield f"event: error\ndata: {json.dumps({'detail': e.detail})}\n\n"
+            except Exception as e:
+                yield f"event: error\ndata: {json.dumps({'detail': str(e)})}\n\n"
 
-    return result
+    return StreamingResponse(events(), media_type="text/event-stream")
 
 
 @app.post("/ecosystem/chat", response_model=ChatResponse)
-async def chat(request: ChatRequest):
+async def chat(request: ChatRequest, session_id: str = Depends(get_session_id)):
     """Chat about the ecosystem without advancing time."""
-    if current_ecosystem is None:
-        raise HTTPException(status_code=404, detail="No ecosystem exists. Create one first.")
-
-    response_text = await chat_about_ecosystem(current_ecosystem, request.message)
+    # Read-only, so no lock: chat sees the latest completed turn
+    response_text = await chat_about_ecosystem(require_ecosystem(session_id), request.message, session_id)
     return ChatResponse(response=response_text)
 
 
+@app.post("/ecosystem/chat/stream")
+async def chat_stream(request: ChatRequest, session_id: str = Depends(get_session_id)):
+    """Chat about the ecosystem, streaming the reply as plain text."""
+    return StreamingResponse(
+        stream_chat_about_ecosystem(require_ecosystem(session_id), request.message),
+        media_type="text/plain; charset=utf-8",
+    )
+
+
 @app.get("/ecosystem/species")
-async def get_species():
+async def get_species(session_id: str = Depends(get_session_id)):
     """Get just the species list with populations."""
-    if current_ecosystem is None:
-        raise HTTPException(status_code=404, detail="No ecosystem exists. Create one first.")
-
     return [
         {"name": s.name, "population": s.population, "diet": s.diet}
-        for s in current_ecosystem.species
+        for s in require_ecosystem(session_id).species
     ]
 
 
 @app.post("/ecosystem/load", response_model=EcosystemState)
-async def load_ecosystem(state: EcosystemState):
+async def load_ecosystem(state: EcosystemState, session_id: str = Depends(get_session_id)):
     """Load a saved ecosystem state."""
-    global current_ecosystem
-    current_ecosystem = state
-    return current_ecosystem
+    async with session_lock(session_id):
+        sessions[session_id] = state
+        return model_response(state)
 
 
 if __name__ == "__main__":
+    import sys
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    # uvloop and httptools cut event-loop and HTTP parsing overhead; uvloop has no Windows build
+    uvicorn.run(
+        app,
+        host="0.0.0.0",
+        port=8000,
+        loop="asyncio" if sys.platform == "win32" else "uvloop",
+        http="httptools",
+    )
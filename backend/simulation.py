@@ -4,24 +4,53 @@ Handles world state management and AI-driven simulation.
 """
 
 import os
-import json
+import re
 import asyncio
+import hashlib
+import functools
+from collections import Counter, defaultdict, deque
+from typing import AsyncIterator, Awaitable, Callable, NamedTuple, TypeVar
+import diskcache
+import httpx
+import numpy as np
+import orjson
+from cachetools import TTLCache
 from dotenv import load_dotenv
 from google import genai
-from google.genai import types
+from google.genai import errors, types
+from pydantic import BaseModel, TypeAdapter
+from batching import BatchQueue
 from schemas import (
     EcosystemState,
+    SimulationDelta,
     SimulationResult,
     UserIntervention,
     Species,
     Tile,
     BiomeType,
     DietType,
+    ThinkingLevel,
 )
 
 load_dotenv()
 
-client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
+client = genai.Client(
+    api_key=os.getenv("GEMINI_API_KEY"),
+    http_options=types.HttpOptions(
+        timeout=60_000,  # milliseconds
+        # Keep warm HTTP/2 connections so bursts of calls skip TCP/TLS setup.
+        # Only the async client is used (client.aio), so only it is tuned.
+        async_client_args={
+            "limits": httpx.Limits(max_connections=200, max_keepalive_connections=100),
+            "http2": True,
+        },
+    ),
+)
+
+SIMULATION_MODEL = "gemini-3-flash-preview"
+# Chat replies are short and don't need the simulation model's capability
+CHAT_MODEL = os.getenv("GEMINI_CHAT_MODEL", "gemini-3.1-flash-lite-preview")
+CHAT_MAX_OUTPUT_TOKENS = 256
 
 SYSTEM_PROMPT = """You are an advanced ecosystem simulation engine. Your role is to realistically simulate the consequences of time passing and user interventions on a virtual ecosystem set on a Hawaiian island.
 
@@ -44,9 +73,311 @@ When advancing the simulation:
 
 Be scientifically grounded but make it engaging. The user should feel like they're observing a living world."""
 
+EVENTS_LOG_LIMIT = 20  # Recent events kept in EcosystemState.events_log
+
+CHAT_FALLBACK = "Sorry, I couldn't process that request. Please try again."
+
+# Fixed biome ordering used to index per-biome NumPy arrays
+BIOMES = list(BiomeType)
+BIOME_INDEX = {biome: i for i, biome in enumerate(BIOMES)}
+
+# Cached responses expire so a stock situation (e.g. turn 1 of a new ecosystem) isn't
+# answered identically for every user forever
+CACHE_TTL = float(os.getenv("GEMINI_CACHE_TTL", 6 * 60 * 60))  # seconds
+
+# Cache of Gemini responses keyed by (model, state, input) so retries and demo replays skip the round-trip.
+# Entries are validated objects (advance deltas) or plain text (chat) and must never be mutated.
+response_cache: TTLCache[str, str | SimulationDelta] = TTLCache(maxsize=256, ttl=CACHE_TTL)
+cache_lock = asyncio.Lock()
+
+# Second-level cache on disk, so responses survive restarts and demos can be replayed
+CACHE_DIR = os.getenv("GEMINI_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".gemini_cache"))
+# Bump when the format of cached responses changes, so stale disk entries are ignored
+CACHE_VERSION = 1
+
+# Gemini calls currently running, so identical concurrent requests share one call
+inflight: dict[str, asyncio.Task] = {}
+
+T = TypeVar("T")
+
+
+@functools.cache
+def disk_cache() -> diskcache.Cache:
+    """Open the disk cache on first use, so importing this module creates no files."""
+    return diskcache.Cache(CACHE_DIR, size_limit=2**30)
+
+
+def make_cache_key(kind: str, model: str, state: EcosystemState, prompt_input: str) -> str:
+    """Deterministic hash of the model and state (minus the event log) plus the prompt input."""
+    state_json = state.model_dump_json(exclude={"events_log"})
+    return hashlib.blake2b(
+        f"{CACHE_VERSION}:{kind}:{model}".encode() + state_json.encode() + prompt_input.encode()
+    ).hexdigest()
+
+
+def encode_cached(value: str | BaseModel) -> str:
+    # Disk entries are always JSON text; memory keeps the validated object
+    return value.model_dump_json() if isinstance(value, BaseModel) else value
+
+
+async def cache_get(key: str, decode: Callable[[str], T] = str) -> T | None:
+    """
+    Look up a response in memory, then on disk. Disk hits are decoded with
+    `decode` (e.g. SimulationDelta.model_validate_json) and promoted to memory.
+    """
+    async with cache_lock:
+        value = response_cache.get(key)
+    if value is not None:
+        return value
+
+    # diskcache is synchronous; keep its file I/O off the event loop
+    raw = await asyncio.to_thread(disk_cache().get, key)
+    if raw is None:
+        return None
+    try:
+        value = decode(raw)
+    except ValueError:
+        # Corrupt, or written in an older format without a CACHE_VERSION bump
+        await asyncio.to_thread(disk_cache().delete, key)
+        return None
+    async with cache_lock:
+        response_cache[key] = value
+    return value
+
+
+async def cache_set(key: str, value: str | BaseModel) -> None:
+    async with cache_lock:
+        response_cache[key] = value
+    await asyncio.to_thread(disk_cache().set, key, encode_cached(value), expire=CACHE_TTL)
+
+
+async def cached_response(
+    key: str,
+    compute: Callable[[], Awaitable[T]],
+    decode: Callable[[str], T] = str
+) -> T:
+    """
+    Return the cached response for key, or compute and store it on a miss.
+    Concurrent misses for the same key share one computation, which runs as
+    its own task so a cancelled caller doesn't cancel it for everyone else.
+    """
+    async with cache_lock:
+        cached = response_cache.get(key)
+        if cached is not None:
+            return cached
+
+        task = inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(fill_cache(key, compute, decode))
+            inflight[key] = task
+            task.add_done_callback(lambda t: finish_inflight(key, t))
+
+    return await asyncio.shield(task)
+
+
+async def fill_cache(key: str, compute: Callable[[], Awaitable[T]], decode: Callable[[str], T]) -> T:
+    value = await cache_get(key, decode)  # Memory missed already; this checks the disk
+    if value is None:
+        value = await compute()
+        await cache_set(key, value)
+    return value
+
+
+def finish_inflight(key: str, task: asyncio.Task) -> None:
+    if inflight.get(key) is task:
+        del inflight[key]
+    # Retrieve the exception so one every caller abandoned isn't logged as unhandled
+    if not task.cancelled():
+        task.exception()
+
+
+def combine_prompts(prompts: list[str]) -> str:
+    """
+    Merge several independent prompts into one batched prompt.
+    Prompts contain free text (chat messages, loaded species
+    names) that the model sees side by side, so callers must only combine
+    prompts from the same session - see the batch group in chat_about_ecosystem.
+    """
+    sections = "\n\n".join(
+        f"### REQUEST {k}\n{prompt}" for k, prompt in enumerate(prompts)
+    )
+    return f"""You are answering {len(prompts)} independent requests in one reply.
+Treat each request separately; do not mix information between them.
+Return a JSON array with exactly {len(prompts)} entries, where entry k answers REQUEST k.
+
+{sections}"""
+
+
+chat_replies_adapter = TypeAdapter(list[str])
+
+# Gemini configs are built once at import rather than per call.
+# Chat answers are short; extra reasoning adds latency without improving them.
+CHAT_CONFIG = types.GenerateContentConfig(
+    system_instruction=SYSTEM_PROMPT,
+    max_output_tokens=CHAT_MAX_OUTPUT_TOKENS,
+    thinking_config=types.ThinkingConfig(thinking_level=types.ThinkingLevel.MINIMAL),
+)
+CHAT_BATCH_CONFIG = CHAT_CONFIG.model_copy(
+    update={"response_mime_type": "application/json", "response_schema": list[str]}
+)
+
+
+def advance_config(level: ThinkingLevel | None) -> types.GenerateContentConfig:
+    return types.GenerateContentConfig(
+        system_instruction=SYSTEM_PROMPT,
+        response_mime_type="application/json",
+        response_schema=SimulationDelta,
+        # None leaves thinking at the model default
+        thinking_config=types.ThinkingConfig(thinking_level=types.ThinkingLevel(level.value.upper())) if level else None,
+    )
+
+
+# Keyed by requested thinking level
+ADVANCE_CONFIGS = {level: advance_config(level) for level in [None, *ThinkingLevel]}
+
+
+HEDGE_MIN_DELAY = float(os.getenv("GEMINI_HEDGE_DELAY", "10"))  # Never hedge a request younger than this
+HEDGE_PERCENTILE = 0.95  # Hedge only requests slower than this share of recent ones
+MAX_ATTEMPTS = 3  # The original request plus up to 2 hedges or retries
+RETRY_BACKOFF = 1.0  # Seconds before the first retry of a failed request, doubling after
+
+# Seconds taken by recent successful calls, used to pick the hedge delay
+recent_latencies: deque[float] = deque(maxlen=100)
+
+
+def hedge_delay() -> float:
+    """Seconds to wait on a request before hedging it."""
+    observed = 0.0
+    if len(recent_latencies) >= 10:
+        observed = sorted(recent_latencies)[int(len(recent_latencies) * HEDGE_PERCENTILE)]
+    return max(HEDGE_MIN_DELAY, observed)
+
+
+def is_transient(error: BaseException) -> bool:
+    """Whether a failed Gemini call may succeed on retry: server errors, rate limits and network failures."""
+    if isinstance(error, errors.APIError):
+        return isinstance(error, errors.ServerError) or error.code in (408, 429)
+    return isinstance(error, httpx.TransportError)
+
+
+async def generate_hedged(contents: str, config: types.GenerateContentConfig) -> str:
+    """
+    Call Gemini, firing a backup request when the latest one is slower than
+    hedge_delay(), and return the first non-empty text. Errors and empty
+    replies are not hedged: other requests in flight are awaited first, then
+    the call is retried with exponential backoff. Errors that a retry can't
+    fix (bad request, bad API key) are raised at once. Requests still running
+    once one succeeds are cancelled.
+    """
+    loop = asyncio.get_running_loop()
+    delay = hedge_delay()
+    pending: set[asyncio.Task] = set()
+    started: dict[asyncio.Task, float] = {}
+    attempts = 0
+    last_error: Exception | None = None
+
+    def launch() -> None:
+        nonlocal attempts
+        attempts += 1
+        task = asyncio.create_task(client.aio.models.generate_content(
+            model=SIMULATION_MODEL,
+            contents=contents,
+            config=config,
+        ))
+        started[task] = loop.time()
+        pending.add(task)
+
+    try:
+        launch()
+        while pending:
+            done, pending = await asyncio.wait(
+                pending,
+                timeout=delay if attempts < MAX_ATTEMPTS else None,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            if not done:
+                launch()  # Slow, not failed - hedge
+                continue
+
+            for task in done:
+                if task.exception() is not None:
+                    if not is_transient(task.exception()):
+                        raise task.exception()
+                    last_error = task.exception()
+                elif task.result().text is not None:
+                    recent_latencies.append(loop.time() - started[task])
+                    return task.result().text
+
+            if not pending and attempts < MAX_ATTEMPTS:
+                await asyncio.sleep(RETRY_BACKOFF * 2 ** (attempts - 1))
+                launch()
+    finally:
+        for task in pending:
+            task.cancel()
+
+    if last_error is not None:
+        raise last_error
+    raise ValueError(f"Gemini returned an empty response after {MAX_ATTEMPTS} attempts. Please try again.")
+
+
+async def generate_simulation_delta(prompt: str, level: ThinkingLevel | None) -> SimulationDelta:
+    """Run one Gemini call for an advance prompt and return the validated delta."""
+    text = await generate_hedged(contents=prompt, config=ADVANCE_CONFIGS[level])
+    # Validate before caching so a malformed response is never replayed
+    return SimulationDelta.model_validate_json(text)
+
+
+async def run_chat_batch(_session_id: str | None, prompts: list[str]) -> list[str]:
+    """Run one Gemini call for a batch of chat prompts, returning one reply for each."""
+    batched = len(prompts) > 1
+
+    response = await client.aio.models.generate_content(
+        model=CHAT_MODEL,
+        contents=combine_prompts(prompts) if batched else prompts[0],
+        config=CHAT_BATCH_CONFIG.model_copy(
+            # Each batched reply gets the same output budget as a single one
+            update={"max_output_tokens": CHAT_MAX_OUTPUT_TOKENS * len(prompts)}
+        ) if batched else CHAT_CONFIG,
+    )
+
+    if response.text is None:
+        raise ValueError("Gemini returned an empty response.")
+
+    if not batched:
+        return [response.text]
+
+    # Validate before caching so a malformed reply is never replayed
+    replies = chat_replies_adapter.validate_json(response.text)
+    if len(replies) != len(prompts):
+        raise ValueError(f"Gemini returned {len(replies)} replies for {len(prompts)} batched requests.")
+    return replies
+
+
+# Started and stopped by the FastAPI lifespan in main.py.
+# Turns aren't batched: each session runs one turn at a time, so there is nothing to batch.
+chat_queue = BatchQueue(run_chat_batch)
+
 
 def create_initial_ecosystem(grid_size: int = 8) -> EcosystemState:
     """Create a starting ecosystem with default species and terrain."""
+    # Copy only the mutable lists - a deep copy costs more than rebuilding the template
+    template = _build_template(grid_size)
+    return template.model_copy(update={
+        "tiles": [
+            tile.model_copy(update={"species_present": list(tile.species_present)})
+            for tile in template.tiles
+        ],
+        "species": [
+            sp.model_copy(update={"prey": list(sp.prey), "predators": list(sp.predators)})
+            for sp in template.species
+        ],
+        "events_log": list(template.events_log),
+    })
+
+
+@functools.lru_cache(maxsize=8)
+def _build_template(grid_size: int) -> EcosystemState:
+    """Build the starting ecosystem for a grid size. Cached - never mutate the result."""
 
     tiles = []
     for x in range(grid_size):
@@ -54,7 +385,7 @@ def create_initial_ecosystem(grid_size: int = 8) -> EcosystemState:
             # Simple terrain generation - varies by position
             if x < grid_size // 3:
                 biome = BiomeType.FOREST
-                elevation = 30 + (y * 5)
+                elevation = min(100, 30 + (y * 5))  # Stay within Tile's 0-100 range on large grids
                 water = 60
                 vegetation = 80
             elif x < 2 * grid_size // 3:
@@ -68,6 +399,7 @@ def create_initial_ecosystem(grid_size: int = 8) -> EcosystemState:
                 water = 90 if y < grid_size // 2 else 20
                 vegetation = 40 if y < grid_size // 2 else 20
 
+            # Validated on purpose: this runs once per grid size (the template is cached)
             tiles.append(Tile(
                 x=x,
                 y=y,
@@ -163,10 +495,11 @@ def create_initial_ecosystem(grid_size: int = 8) -> EcosystemState:
     ]
 
     # Distribute species across tiles based on preferred biomes
+    species_by_biome: defaultdict[BiomeType, list[str]] = defaultdict(list)
+    for sp in species:
+        species_by_biome[sp.preferred_biome].append(sp.name)
     for tile in tiles:
-        for sp in species:
-            if tile.biome == sp.preferred_biome:
-                tile.species_present.append(sp.name)
+        tile.species_present = list(species_by_biome[tile.biome])
 
     return EcosystemState(
         turn=0,
@@ -179,84 +512,211 @@ def create_initial_ecosystem(grid_size: int = 8) -> EcosystemState:
     )
 
 
-async def advance_simulation(
-    current_state: EcosystemState,
-    intervention: UserIntervention | None = None
-) -> SimulationResult:
-    """
-    Advance the ecosystem by one turn using Gemini 3 for reasoning.
-    Optionally apply a user intervention.
-    """
-
-    prompt_parts = [
-        f"Current ecosystem state (Turn {current_state.turn}):\n",
-        f"Season: {current_state.season}, Temperature: {current_state.temperature}°C\n\n",
-        "Species populations:\n"
-    ]
-
-    for sp in current_state.species:
-        prompt_parts.append(
-            f"- {sp.name}: {sp.population} (eats: {sp.prey}, eaten by: {sp.predators})\n"
-        )
-
-    prompt_parts.append(f"\nGrid summary ({current_state.grid_size}x{current_state.grid_size}):\n")
+# Build the default-size template up front so the first /ecosystem/new is fast
+_build_template(8)
 
-    # Summarize biomes
-    biome_counts = {}
-    for tile in current_state.tiles:
-        biome_counts[tile.biome] = biome_counts.get(tile.biome, 0) + 1
-    for biome, count in biome_counts.items():
-        prompt_parts.append(f"- {biome.value}: {count} tiles\n")
 
-    if intervention:
-        prompt_parts.append(f"\n**USER INTERVENTION**: {intervention.action}")
-        if intervention.details:
-            prompt_parts.append(f" ({intervention.details})")
-        prompt_parts.append("\n")
-
-    prompt_parts.append("""
+ADVANCE_INSTRUCTIONS = """
 Advance the simulation by one turn. Consider:
 1. How populations change based on predator-prey relationships
 2. Seasonal effects (next season if appropriate)
 3. Any natural events (storms, disease, migration)
 4. Effects of the user intervention if provided
 
-Return the complete new state with updated populations, any new events, and a narrative summary.""")
+Return the new population of every species, any newly introduced species,
+the season and temperature after this turn, any new events, and a narrative summary."""
 
-    prompt = "".join(prompt_parts)
 
-    # Retry up to 3 times if Gemini returns empty response
-    for attempt in range(3):
-        response = await client.aio.models.generate_content(
-            model="gemini-3-flash-preview",
-            contents=prompt,
-            config=types.GenerateContentConfig(
-                system_instruction=SYSTEM_PROMPT,
-                response_mime_type="application/json",
-                response_schema=SimulationResult,
-            ),
-        )
+def build_advance_prompt(
+    current_state: EcosystemState,
+    intervention: UserIntervention | None = None
+) -> str:
+    """Build the Gemini prompt for advancing the ecosystem by one turn."""
 
-        if response.text is not None:
-            break
+    # Compact CSV-style encoding keeps prompt tokens (and prefill time) down
+    species = ";".join(
+        f"{sp.name},{sp.population},{'|'.join(sp.prey)},{'|'.join(sp.predators)}"
+        for sp in current_state.species
+    )
+    biome_counts = Counter(tile.biome for tile in current_state.tiles)
+    biomes = ",".join(f"{biome.value}:{count}" for biome, count in biome_counts.items())
 
-        if attempt < 2:
-            await asyncio.sleep(2)  # Wait 2 seconds before retry
+    intervention_line = ""
+    if intervention:
+        details = f" ({intervention.details})" if intervention.details else ""
+        intervention_line = f"\n**USER INTERVENTION**: {intervention.action}{details}\n"
+
+    return f"""Current ecosystem state (Turn {current_state.turn}):
+Season: {current_state.season}, Temperature: {current_state.temperature}°C
+species(name,pop,prey,predators): {species}
+grid {current_state.grid_size}x{current_state.grid_size}, biome tiles: {biomes}
+{intervention_line}{ADVANCE_INSTRUCTIONS}"""
+
+
+def advance_cache_key(
+    current_state: EcosystemState,
+    intervention: UserIntervention | None = None
+) -> str:
+    intervention_input = intervention.model_dump_json() if intervention else ""
+    return make_cache_key("advance", SIMULATION_MODEL, current_state, intervention_input)
+
+
+def chat_cache_key(current_state: EcosystemState, user_message: str) -> str:
+    return make_cache_key("chat", CHAT_MODEL, current_state, user_message)
 
-    if response.text is None:
-        raise ValueError("Gemini returned an empty response after 3 attempts. Please try again.")
 
-    result = SimulationResult.model_validate_json(response.text)
-    result.new_state.turn = current_state.turn + 1
+def apply_simulation_delta(current_state: EcosystemState, delta: SimulationDelta) -> SimulationResult:
+    """Rebuild the next turn's full state from Gemini's already-validated delta."""
+    populations = {update.name: update.population for update in delta.populations}
+    species = [
+        sp.model_copy(update={"population": populations.get(sp.name, sp.population)})
+        for sp in current_state.species
+    ]
+    existing = {sp.name for sp in species}
+    for sp in delta.new_species:
+        # Gemini may also repeat a name within new_species itself
+        if sp.name not in existing:
+            existing.add(sp.name)
+            species.append(sp)
+
+    new_state = EcosystemState(
+        turn=current_state.turn + 1,
+        grid_size=current_state.grid_size,
+        # Update tiles based on species changes (Gemini doesn't manage tiles directly)
+        tiles=update_tiles_from_state(current_state.tiles, species, delta.season),
+        species=species,
+        season=delta.season,
+        temperature=delta.temperature,
+        events_log=(current_state.events_log + [e.description for e in delta.events])[-EVENTS_LOG_LIMIT:],
+    )
 
-    # Update tiles based on species changes (Gemini doesn't manage tiles directly)
-    result.new_state.tiles = update_tiles_from_state(
-        current_state.tiles,
-        result.new_state.species,
-        result.new_state.season
+    return SimulationResult(
+        new_state=new_state,
+        events=delta.events,
+        narration=delta.narration,
+        warnings=delta.warnings,
     )
 
-    return result
+
+async def advance_simulation(
+    current_state: EcosystemState,
+    intervention: UserIntervention | None = None
+) -> SimulationResult:
+    """
+    Advance the ecosystem by one turn using Gemini 3 for reasoning.
+    Optionally apply a user intervention.
+    """
+    prompt = build_advance_prompt(current_state, intervention)
+    key = advance_cache_key(current_state, intervention)
+    level = intervention.thinking_level if intervention else None
+    delta = await cached_response(
+        key, lambda: generate_simulation_delta(prompt, level), decode=SimulationDelta.model_validate_json
+    )
+    return apply_simulation_delta(current_state, delta)
+
+
+async def stream_advance_simulation(
+    current_state: EcosystemState,
+    intervention: UserIntervention | None = None
+) -> AsyncIterator[str | SimulationResult]:
+    """
+    Like advance_simulation, but streams the narration as Gemini generates it.
+    Yields narration text chunks, then the final SimulationResult.
+
+    A stream that fails or comes back empty/invalid before any narration was
+    sent is retried through the buffered path (generate_simulation_delta), which has
+    the same hedging and backoff as advance_simulation. Once narration has
+    been sent a retry could contradict it, so later errors are raised.
+    """
+    key = advance_cache_key(current_state, intervention)
+    delta = await cache_get(key, SimulationDelta.model_validate_json)
+
+    if delta is None:
+        prompt = build_advance_prompt(current_state, intervention)
+        level = intervention.thinking_level if intervention else None
+        buffer = ""
+        narration_sent = 0
+        try:
+            stream = await client.aio.models.generate_content_stream(
+                model=SIMULATION_MODEL,
+                contents=prompt,
+                config=ADVANCE_CONFIGS[level],
+            )
+            async for chunk in stream:
+                if not chunk.text:
+                    continue
+                buffer += chunk.text
+                narration = partial_json_string(buffer, "narration")
+                if narration is not None and len(narration) > narration_sent:
+                    yield narration[narration_sent:]
+                    narration_sent = len(narration)
+
+            if not buffer:
+                raise ValueError("Gemini returned an empty response. Please try again.")
+
+            # Validate the complete JSON before caching it
+            delta = SimulationDelta.model_validate_json(buffer)
+        except Exception:
+            if narration_sent:
+                raise
+            delta = await generate_simulation_delta(prompt, level)
+
+        await cache_set(key, delta)
+        result = apply_simulation_delta(current_state, delta)
+        if len(result.narration) > narration_sent:
+            yield result.narration[narration_sent:]
+    else:
+        result = apply_simulation_delta(current_state, delta)
+        yield result.narration
+
+    yield result
+
+
+def partial_json_string(buffer: str, field: str) -> str | None:
+    """
+    Extract the (possibly still incomplete) string value of `field` from
+    partially received JSON, or None if it hasn't started yet.
+    """
+    match = re.search(rf'"{field}"\s*:\s*"', buffer)
+    if match is None:
+        return None
+
+    start = end = match.end()
+    while end < len(buffer) and buffer[end] != '"':
+        end += 2 if buffer[end] == "\\" else 1
+    raw = buffer[start:min(end, len(buffer))]
+
+    # An escape sequence may be cut off mid-stream; it completes with the next chunk
+    for cut in range(min(6, len(raw)) + 1):
+        try:
+            return orjson.loads(f'"{raw[:len(raw) - cut]}"')
+        except orjson.JSONDecodeError:
+            continue
+    return None
+
+
+class SpeciesLayout(NamedTuple):
+    """Population-independent grouping of species by preferred biome."""
+    biome_of: np.ndarray  # BIOME_INDEX of each species
+    is_producer: np.ndarray
+    is_herbivore: np.ndarray
+    has_producers: np.ndarray  # per biome
+    members_by_biome: tuple[tuple[int, ...], ...]  # species indices per biome
+
+
+@functools.lru_cache(maxsize=32)
+def species_layout(key: tuple[tuple[str, BiomeType, DietType], ...]) -> SpeciesLayout:
+    """Group species (given as (name, preferred_biome, diet) tuples) by biome. Cached - never mutate the result."""
+    biome_of = np.array([BIOME_INDEX[biome] for _, biome, _ in key], dtype=np.intp)
+    is_producer = np.array([diet == DietType.PRODUCER for _, _, diet in key], dtype=np.float64)
+    is_herbivore = np.array([diet == DietType.HERBIVORE for _, _, diet in key], dtype=np.float64)
+    has_producers = np.bincount(biome_of, weights=is_producer, minlength=len(BIOMES)) > 0
+    members_by_biome = tuple(
+        tuple(j for j, b in enumerate(biome_of) if b == i) for i in range(len(BIOMES))
+    )
+    for arr in (biome_of, is_producer, is_herbivore, has_producers):
+        arr.flags.writeable = False
+    return SpeciesLayout(biome_of, is_producer, is_herbivore, has_producers, members_by_biome)
 
 
 def update_tiles_from_state(
@@ -268,69 +728,63 @@ def update_tiles_from_state(
     Update tile vegetation and species_present based on the new species state.
     This derives visual changes from Gemini's species population decisions.
     """
-    # Build lookup of species by preferred biome
-    species_by_biome: dict[BiomeType, list[Species]] = {}
-    for sp in species:
-        if sp.preferred_biome not in species_by_biome:
-            species_by_biome[sp.preferred_biome] = []
-        species_by_biome[sp.preferred_biome].append(sp)
-
-    # Calculate total producer (plant) population for vegetation scaling
-    total_plants = sum(sp.population for sp in species if sp.diet == DietType.PRODUCER)
     max_plants = 15000  # Baseline for full vegetation
 
-    updated_tiles = []
-    for tile in tiles:
-        new_tile = tile.model_copy()
-
-        # Update species_present based on which species prefer this biome
-        new_tile.species_present = []
-        biome_species = species_by_biome.get(tile.biome, [])
-        for sp in biome_species:
-            if sp.population > 0:
-                new_tile.species_present.append(sp.name)
-
-        # Update vegetation based on producer populations in this biome type
-        biome_producers = [sp for sp in biome_species if sp.diet == DietType.PRODUCER]
-        if biome_producers:
-            producer_pop = sum(sp.population for sp in biome_producers)
-            # Scale vegetation 0-100 based on population
-            new_tile.vegetation = min(100, max(5, int(producer_pop / max_plants * 100 * 1.5)))
-
-        # Seasonal effects on vegetation
-        if season == "winter":
-            new_tile.vegetation = max(10, int(new_tile.vegetation * 0.6))
-        elif season == "spring":
-            new_tile.vegetation = min(100, int(new_tile.vegetation * 1.2))
-        elif season == "summer":
-            new_tile.vegetation = min(100, int(new_tile.vegetation * 1.1))
-        # fall: no change
-
-        # Herbivore grazing reduces vegetation slightly
-        biome_herbivores = [sp for sp in biome_species if sp.diet == DietType.HERBIVORE]
-        herbivore_pop = sum(sp.population for sp in biome_herbivores)
-        grazing_impact = min(20, int(herbivore_pop / 50))
-        new_tile.vegetation = max(5, new_tile.vegetation - grazing_impact)
-
-        updated_tiles.append(new_tile)
-
-    return updated_tiles
+    # Grouping only changes when species are added or removed; populations change every turn
+    layout = species_layout(tuple((sp.name, sp.preferred_biome, sp.diet) for sp in species))
+    populations = np.fromiter((sp.population for sp in species), dtype=np.float64, count=len(species))
 
+    present_by_biome = [
+        [species[j].name for j in members if populations[j] > 0]
+        for members in layout.members_by_biome
+    ]
+    producer_pop = np.bincount(
+        layout.biome_of, weights=populations * layout.is_producer, minlength=len(BIOMES)
+    )
+    herbivore_pop = np.bincount(
+        layout.biome_of, weights=populations * layout.is_herbivore, minlength=len(BIOMES)
+    )
+    has_producers = layout.has_producers
+
+    # Struct-of-arrays view of the tiles
+    tile_biomes = np.fromiter((BIOME_INDEX[t.biome] for t in tiles), dtype=np.intp, count=len(tiles))
+    vegetation = np.fromiter((t.vegetation for t in tiles), dtype=np.float64, count=len(tiles))
+
+    # Scale vegetation 0-100 based on producer populations in the tile's biome
+    scaled = np.clip(np.floor(producer_pop / max_plants * 100 * 1.5), 5, 100)
+    vegetation = np.where(has_producers[tile_biomes], scaled[tile_biomes], vegetation)
+
+    # Seasonal effects on vegetation
+    if season == "winter":
+        vegetation = np.maximum(10, np.floor(vegetation * 0.6))
+    elif season == "spring":
+        vegetation = np.minimum(100, np.floor(vegetation * 1.2))
+    elif season == "summer":
+        vegetation = np.minimum(100, np.floor(vegetation * 1.1))
+    # fall: no change
+
+    # Herbivore grazing reduces vegetation slightly
+    grazing_impact = np.minimum(20, np.floor(herbivore_pop / 50))
+    vegetation = np.maximum(5, vegetation - grazing_impact[tile_biomes])
+
+    return [
+        Tile.model_construct(**{
+            **tile.__dict__,
+            "vegetation": veg,
+            "species_present": list(present_by_biome[biome]),
+        })
+        for tile, biome, veg in zip(tiles, tile_biomes.tolist(), vegetation.tolist())
+    ]
 
-async def chat_about_ecosystem(
-    current_state: EcosystemState,
-    user_message: str
-) -> str:
-    """
-    Have a conversation about the ecosystem without advancing time.
-    Answer questions, explain dynamics, suggest interventions.
-    """
+
+def build_chat_prompt(current_state: EcosystemState, user_message: str) -> str:
+    """Build the Gemini prompt for a chat question about the ecosystem."""
 
     state_summary = f"""Current ecosystem (Turn {current_state.turn}, {current_state.season}):
 Species: {', '.join(f"{s.name}({s.population})" for s in current_state.species)}
 """
 
-    prompt = f"""{state_summary}
+    return f"""{state_summary}
 
 User question: {user_message}
 
@@ -338,15 +792,59 @@ Provide a helpful, scientifically-grounded response about this ecosystem.
 If the user is asking what they should do, suggest interesting interventions.
 Keep responses concise but informative."""
 
-    response = await client.aio.models.generate_content(
-        model="gemini-3-flash-preview",
-        contents=prompt,
-        config=types.GenerateContentConfig(
-            system_instruction=SYSTEM_PROMPT,
-        ),
-    )
 
-    if response.text is None:
-        return "Sorry, I couldn't process that request. Please try again."
+async def chat_about_ecosystem(
+    current_state: EcosystemState,
+    user_message: str,
+    session_id: str | None = None
+) -> str:
+    """
+    Have a conversation about the ecosystem without advancing time.
+    Answer questions, explain dynamics, suggest interventions.
+    """
+    prompt = build_chat_prompt(current_state, user_message)
+    key = chat_cache_key(current_state, user_message)
+    try:
+        # Chat messages are raw user text, so only batch within one session
+        return await cached_response(key, lambda: chat_queue.submit(prompt, group=session_id))
+    except ValueError:
+        return CHAT_FALLBACK
 
-    return response.text
+
+async def stream_chat_about_ecosystem(
+    current_state: EcosystemState,
+    user_message: str
+) -> AsyncIterator[str]:
+    """
+    Like chat_about_ecosystem, but yields the reply as Gemini generates it.
+    Errors never escape: they are answered with CHAT_FALLBACK if nothing was
+    sent yet, and otherwise end the (uncached) reply early.
+    """
+    key = chat_cache_key(current_state, user_message)
+    cached = await cache_get(key)
+    if cached is not None:
+        yield cached
+        return
+
+    parts = []
+    try:
+        stream = await client.aio.models.generate_content_stream(
+            model=CHAT_MODEL,
+            contents=build_chat_prompt(current_state, user_message),
+            config=CHAT_CONFIG,
+        )
+        async for chunk in stream:
+            if chunk.text:
+                parts.append(chunk.text)
+                yield chunk.text
+    except Exception:
+        # Headers are already sent, so the response can't turn into an error status
+        if not parts:
+            yield CHAT_FALLBACK
+        return
+
+    if not parts:
+        yield CHAT_FALLBACK
+        return
+
+    await cache_set(key, "".join(parts))
@@ -0,0 +1,60 @@
+"""
+Shared fixtures for the backend tests.
+Gemini is replaced by a fake client so no test touches the network.
+"""
+
+import os
+import sys
+import types as pytypes
+
+import diskcache
+import pytest
+
+os.environ.setdefault("GEMINI_API_KEY", "test-key")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import simulation  # noqa: E402
+
+
+class FakeModels:
+    """
+    Stands in for client.aio.models. `handler` decides each response;
+    `stream_handler` is an async generator yielding each streamed chunk's text.
+    """
+
+    def __init__(self):
+        self.calls: list[dict] = []
+        self.stream_calls: list[dict] = []
+        self.handler = None
+        self.stream_handler = None
+
+    async def generate_content(self, model, contents, config):
+        self.calls.append({"model": model, "contents": contents, "config": config})
+        text = await self.handler(model, contents, config)
+        return pytypes.SimpleNamespace(text=text)
+
+    async def generate_content_stream(self, model, contents, config):
+        self.stream_calls.append({"model": model, "contents": contents, "config": config})
+
+        async def chunks():
+            async for text in self.stream_handler(model, contents, config):
+                yield pytypes.SimpleNamespace(text=text)
+
+        return chunks()
+
+
+@pytest.fixture(autouse=True)
+def isolated_caches(monkeypatch, tmp_path):
+    """Give every test empty caches and a throwaway disk cache."""
+    simulation.response_cache.clear()
+    simulation.inflight.clear()
+    simulation.recent_latencies.clear()
+    cache = diskcache.Cache(str(tmp_path / "cache"))
+    monkeypatch.setattr(simulation, "disk_cache", lambda: cache)
+
+
+@pytest.fixture
+def fake_gemini(monkeypatch) -> FakeModels:
+    models = FakeModels()
+    monkeypatch.setattr(simulation, "client", pytypes.SimpleNamespace(aio=pytypes.SimpleNamespace(models=models)))
+    return models
@@ -0,0 +1,168 @@
+"""Tests for BatchQueue and the batched Gemini runners."""
+
+import asyncio
+
+import orjson
+import pytest
+
+import simulation
+from batching import BatchQueue
+
+
+def test_concurrent_submits_share_one_batch_and_split_in_order():
+    batches = []
+
+    async def run_batch(group, prompts):
+        batches.append((group, prompts))
+        return [f"reply to {p}" for p in prompts]
+
+    async def main():
+        queue = BatchQueue(run_batch, window=0.02)
+        queue.start()
+        try:
+            return await asyncio.gather(*(queue.submit(f"p{i}") for i in range(3)))
+        finally:
+            await queue.stop()
+
+    replies = asyncio.run(main())
+    assert replies == ["reply to p0", "reply to p1", "reply to p2"]
+    assert batches == [(None, ["p0", "p1", "p2"])]
+
+
+def test_different_groups_are_never_batched_together():
+    batches = []
+
+    async def run_batch(group, prompts):
+        batches.append((group, prompts))
+        return prompts
+
+    async def main():
+        queue = BatchQueue(run_batch, window=0.02)
+        queue.start()
+        try:
+            await asyncio.gather(queue.submit("a", group=1), queue.submit("b", group=2), queue.submit("c", group=1))
+        finally:
+            await queue.stop()
+
+    asyncio.run(main())
+    assert sorted(batches) == [(1, ["a", "c"]), (2, ["b"])]
+
+
+def test_batch_failure_reaches_every_caller():
+    async def run_batch(group, prompts):
+        raise ValueError("boom")
+
+    async def main():
+        queue = BatchQueue(run_batch, window=0.02)
+        queue.start()
+        try:
+            return await asyncio.gather(queue.submit("a"), queue.submit("b"), return_exceptions=True)
+        finally:
+            await queue.stop()
+
+    results = asyncio.run(main())
+    assert [type(r) for r in results] == [ValueError, ValueError]
+
+
+def test_submit_without_worker_calls_directly():
+    async def run_batch(group, prompts):
+        return [p.upper() for p in prompts]
+
+    assert asyncio.run(BatchQueue(run_batch).submit("x")) == "X"
+
+
+def test_batched_chat_replies_are_split_per_prompt(fake_gemini):
+    async def handler(model, contents, config):
+        return orjson.dumps(["first", "second"]).decode()
+
+    fake_gemini.handler = handler
+    replies = asyncio.run(simulation.run_chat_batch(None, ["q0", "q1"]))
+    assert replies == ["first", "second"]
+    assert "### REQUEST 1\nq1" in fake_gemini.calls[0]["contents"]
+
+
+def test_batched_chat_rejects_non_string_replies(fake_gemini):
+    async def handler(model, contents, config):
+        return '[{"answer": 0}, {"answer": 1}]'
+
+    fake_gemini.handler = handler
+    with pytest.raises(ValueError):
+        asyncio.run(simulation.run_chat_batch(None, ["q0", "q1"]))
+
+
+def test_batched_chat_rejects_wrong_reply_count(fake_gemini):
+    async def handler(model, contents, config):
+        return '["only one"]'
+
+    fake_gemini.handler = handler
+    with pytest.raises(ValueError):
+        asyncio.run(simulation.run_chat_batch(None, ["q0", "q1"]))
+
+
+def test_chat_from_different_sessions_is_not_batched(fake_gemini):
+    async def handler(model, contents, config):
+        return "reply"
+
+    fake_gemini.handler = handler
+    state = simulation.create_initial_ecosystem(4)
+
+    async def main():
+        simulation.chat_queue.start()
+        try:
+            await asyncio.gather(
+                simulation.chat_about_ecosystem(state, "from alice", session_id="alice"),
+                simulation.chat_about_ecosystem(state, "from bob", session_id="bob"),
+            )
+        finally:
+            await simulation.chat_queue.stop()
+
+    asyncio.run(main())
+    assert len(fake_gemini.calls) == 2
+    for call in fake_gemini.calls:
+        assert "### REQUEST" not in call["contents"]
+
+
+def test_lone_prompt_is_sent_without_waiting_for_the_window():
+    async def run_batch(group, prompts):
+        return prompts
+
+    async def main():
+        queue = BatchQueue(run_batch, window=10)
+        queue.start()
+        try:
+            return await asyncio.wait_for(queue.submit("a"), 1)
+        finally:
+            await queue.stop()
+
+    assert asyncio.run(main()) == "a"
+
+
+def test_stop_cancels_prompts_that_were_never_sent():
+    async def run_batch(group, prompts):
+        return prompts
+
+    async def main():
+        queue = BatchQueue(run_batch, window=10)
+        queue.start()
+        submits = [asyncio.create_task(queue.submit(p)) for p in ("a", "b")]
+        await asyncio.sleep(0.01)  # Both are now waiting out the window
+        await queue.stop()
+        return await asyncio.wait_for(asyncio.gather(*submits, return_exceptions=True), 1)
+
+    results = asyncio.run(main())
+    assert [type(r) for r in results] == [asyncio.CancelledError, asyncio.CancelledError]
+
+
+def test_stop_cancels_prompts_still_in_the_queue():
+    async def run_batch(group, prompts):
+        return prompts
+
+    async def main():
+        queue = BatchQueue(run_batch)
+        queue.start()
+        future = asyncio.get_running_loop().create_future()
+        queue._queue.put_nowait((None, "a", future))  # The worker hasn't run yet
+        await queue.stop()
+        return future
+
+    assert asyncio.run(main()).cancelled()
@@ -0,0 +1,96 @@
+"""Tests for hedged Gemini calls."""
+
+import asyncio
+
+import pytest
+from google.genai import errors
+
+import simulation
+
+
+def api_error(cls, code):
+    return cls(code, {"error": {"code": code, "message": "test", "status": "TEST"}})
+
+
+@pytest.fixture
+def fast_hedging(monkeypatch):
+    monkeypatch.setattr(simulation, "HEDGE_MIN_DELAY", 0.05)
+    monkeypatch.setattr(simulation, "RETRY_BACKOFF", 0.05)
+
+
+def test_slow_request_is_hedged_and_cancelled(fake_gemini, fast_hedging):
+    cancelled = []
+
+    async def handler(model, contents, config):
+        if len(fake_gemini.calls) == 1:
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+        return "hedged"
+
+    fake_gemini.handler = handler
+
+    async def main():
+        text = await simulation.generate_hedged("prompt", simulation.ADVANCE_CONFIGS[None])
+        await asyncio.sleep(0)  # Let the losing request see its cancellation
+        return text
+
+    assert asyncio.run(main()) == "hedged"
+    assert len(fake_gemini.calls) == 2
+    assert cancelled == [True]
+
+
+def test_errors_are_retried_after_a_backoff_not_hedged(fake_gemini, fast_hedging):
+    started = []
+
+    async def handler(model, contents, config):
+        started.append(asyncio.get_running_loop().time())
+        if len(started) == 1:
+            raise api_error(errors.ServerError, 503)
+        return "ok"
+
+    fake_gemini.handler = handler
+    assert asyncio.run(simulation.generate_hedged("prompt", simulation.ADVANCE_CONFIGS[None])) == "ok"
+    assert len(started) == 2
+    assert started[1] - started[0] >= simulation.RETRY_BACKOFF
+
+
+def test_persistent_errors_raise_after_max_attempts(fake_gemini, fast_hedging):
+    async def handler(model, contents, config):
+        raise api_error(errors.ServerError, 503)
+
+    fake_gemini.handler = handler
+    with pytest.raises(errors.ServerError):
+        asyncio.run(simulation.generate_hedged("prompt", simulation.ADVANCE_CONFIGS[None]))
+    assert len(fake_gemini.calls) == simulation.MAX_ATTEMPTS
+
+
+@pytest.mark.parametrize("code", [400, 401, 403])
+def test_permanent_errors_are_raised_without_retrying(fake_gemini, fast_hedging, code):
+    async def handler(model, contents, config):
+        raise api_error(errors.ClientError, code)
+
+    fake_gemini.handler = handler
+    with pytest.raises(errors.ClientError):
+        asyncio.run(simulation.generate_hedged("prompt", simulation.ADVANCE_CONFIGS[None]))
+    assert len(fake_gemini.calls) == 1
+
+
+def test_rate_limits_are_retried(fake_gemini, fast_hedging):
+    async def handler(model, contents, config):
+        if len(fake_gemini.calls) == 1:
+            raise api_error(errors.ClientError, 429)
+        return "ok"
+
+    fake_gemini.handler = handler
+    assert asyncio.run(simulation.generate_hedged("prompt", simulation.ADVANCE_CONFIGS[None])) == "ok"
+
+
+def test_hedge_delay_follows_observed_latency(monkeypatch):
+    monkeypatch.setattr(simulation, "HEDGE_MIN_DELAY", 1.0)
+    assert simulation.hedge_delay() == 1.0  # Too few samples - use the floor
+
+    simulation.recent_latencies.extend([2.0] * 20)
+    assert simulation.hedge_delay() == 2.0
@@ -0,0 +1,27 @@
+"""Tests for per-session state in the API server."""
+
+import asyncio
+import gc
+
+import main
+
+
+def test_session_lock_is_shared_while_in_use_and_dropped_after():
+    async def hold():
+        async with main.session_lock("s1"):
+            assert main.session_lock("s1").locked()
+        assert not main.session_lock("s1").locked()
+
+    asyncio.run(hold())
+    gc.collect()
+    assert "s1" not in main.session_locks
+
+
+def test_sessions_are_bounded():
+    for i in range(main.SESSION_LIMIT + 5):
+        main.sessions[f"s{i}"] = None
+    try:
+        assert len(main.sessions) == main.SESSION_LIMIT
+        assert "s0" not in main.sessions
+    finally:
+        main.sessions.clear()
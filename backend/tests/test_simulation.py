@@ -0,0 +1,210 @@
+"""Tests for the caching, hedging and state-rebuilding parts of the simulation engine."""
+
+import asyncio
+
+import pytest
+
+import simulation
+
+
+def test_identical_concurrent_misses_share_one_call():
+    calls = 0
+
+    async def compute():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return "value"
+
+    async def main():
+        return await asyncio.gather(*(simulation.cached_response("k", compute) for _ in range(3)))
+
+    assert asyncio.run(main()) == ["value"] * 3
+    assert calls == 1
+    assert simulation.response_cache["k"] == "value"
+    assert not simulation.inflight
+
+
+def test_cancelled_leader_does_not_cancel_followers():
+    async def compute():
+        await asyncio.sleep(0.05)
+        return "value"
+
+    async def main():
+        leader = asyncio.create_task(simulation.cached_response("k", compute))
+        await asyncio.sleep(0)
+        followers = [asyncio.create_task(simulation.cached_response("k", compute)) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        return await asyncio.gather(*followers, return_exceptions=True)
+
+    assert asyncio.run(main()) == ["value", "value"]
+
+
+def test_failures_reach_every_waiter_and_are_not_cached():
+    async def compute():
+        await asyncio.sleep(0.01)
+        raise ValueError("boom")
+
+    async def main():
+        return await asyncio.gather(
+            *(simulation.cached_response("k", compute) for _ in range(2)), return_exceptions=True
+        )
+
+    assert [type(r) for r in asyncio.run(main())] == [ValueError, ValueError]
+    assert "k" not in simulation.response_cache
+    assert not simulation.inflight
+
+
+@pytest.mark.parametrize("grid_size", [4, 8, 20])
+def test_initial_ecosystem_is_valid_for_any_grid_size(grid_size):
+    state = simulation.create_initial_ecosystem(grid_size)
+    assert len(state.tiles) == grid_size ** 2
+    # Round-trips through validation, as /ecosystem/load does
+    assert simulation.EcosystemState.model_validate_json(state.model_dump_json()) == state
+
+
+def test_initial_ecosystem_does_not_share_state_with_the_template():
+    state = simulation.create_initial_ecosystem(4)
+    state.tiles[0].species_present.append("intruder")
+    state.tiles[0].vegetation = 0
+    state.species[0].prey.append("intruder")
+    state.events_log.append("mutated")
+
+    assert simulation.create_initial_ecosystem(4) == simulation._build_template(4)
+
+
+def make_delta(state, **overrides):
+    fields = {
+        "populations": [{"name": sp.name, "population": sp.population + 1} for sp in state.species],
+        "season": "summer",
+        "temperature": 25.0,
+        "events": [{"description": "A warm spell", "severity": "low"}],
+        "narration": "Things grew.",
+    }
+    fields.update(overrides)
+    return simulation.SimulationDelta.model_validate(fields)
+
+
+def test_delta_updates_populations_and_adds_only_unknown_species():
+    state = simulation.create_initial_ecosystem(4)
+    existing = state.species[0].model_dump()
+    newcomer = {**existing, "name": "Mongoose", "population": 12}
+    delta = make_delta(state, new_species=[existing, newcomer, {**newcomer, "population": 3}])
+
+    result = simulation.apply_simulation_delta(state, delta)
+
+    assert [sp.population for sp in result.new_state.species[:len(state.species)]] == [
+        sp.population + 1 for sp in state.species
+    ]
+    assert [sp.name for sp in result.new_state.species].count(existing["name"]) == 1
+    assert [sp.name for sp in result.new_state.species].count("Mongoose") == 1
+    assert result.new_state.species[-1].name == "Mongoose"
+    assert result.new_state.species[-1].population == 12
+    assert result.new_state.turn == state.turn + 1
+    assert result.narration == "Things grew."
+    # The input state is left untouched
+    assert state == simulation.create_initial_ecosystem(4)
+
+
+def test_delta_trims_the_events_log():
+    state = simulation.create_initial_ecosystem(4)
+    state.events_log = [f"old {i}" for i in range(simulation.EVENTS_LOG_LIMIT)]
+
+    result = simulation.apply_simulation_delta(state, make_delta(state))
+
+    assert len(result.new_state.events_log) == simulation.EVENTS_LOG_LIMIT
+    assert result.new_state.events_log[-1] == "A warm spell"
+
+
+def test_advance_result_is_replayed_from_memory_and_disk(fake_gemini):
+    state = simulation.create_initial_ecosystem(4)
+
+    async def handler(model, contents, config):
+        return make_delta(state).model_dump_json()
+
+    fake_gemini.handler = handler
+    first = asyncio.run(simulation.advance_simulation(state))
+    assert isinstance(simulation.response_cache[simulation.advance_cache_key(state)], simulation.SimulationDelta)
+
+    assert asyncio.run(simulation.advance_simulation(state)) == first
+    simulation.response_cache.clear()
+    assert asyncio.run(simulation.advance_simulation(state)) == first
+    assert len(fake_gemini.calls) == 1
+
+
+def test_cache_key_depends_on_the_model(monkeypatch):
+    state = simulation.create_initial_ecosystem(4)
+    before = simulation.chat_cache_key(state, "hi")
+    monkeypatch.setattr(simulation, "CHAT_MODEL", "another-model")
+    assert simulation.chat_cache_key(state, "hi") != before
+
+
+def test_disk_cache_entries_expire():
+    asyncio.run(simulation.cache_set("k", "value"))
+    _, expire_time = simulation.disk_cache().get("k", expire_time=True)
+    assert expire_time is not None
+
+
+def test_cached_response_reads_through_the_disk_cache():
+    simulation.disk_cache().set("k", "from disk")
+
+    async def compute():
+        raise AssertionError("should not be called")
+
+    assert asyncio.run(simulation.cached_response("k", compute)) == "from disk"
+    assert simulation.response_cache["k"] == "from disk"
+
+
+def test_undecodable_disk_entry_is_dropped_and_recomputed(fake_gemini):
+    state = simulation.create_initial_ecosystem(4)
+    key = simulation.advance_cache_key(state)
+    simulation.disk_cache().set(key, '{"old": "format"}')
+
+    async def handler(model, contents, config):
+        return make_delta(state).model_dump_json()
+
+    fake_gemini.handler = handler
+    result = asyncio.run(simulation.advance_simulation(state))
+
+    assert result.narration == "Things grew."
+    assert simulation.SimulationDelta.model_validate_json(simulation.disk_cache().get(key)) == make_delta(state)
+
+
+def make_species(name, diet, biome, population):
+    return simulation.Species(
+        name=name, population=population, diet=diet, preferred_biome=biome,
+        reproduction_rate=0.1, territory_size=1,
+    )
+
+
+@pytest.mark.parametrize(
+    ("season", "expected"),
+    [
+        # forest (producers, grazed), grassland (no producers, grazed), desert (nothing), wetland (saturated)
+        ("winter", [26, 10, 10, 60]),
+        ("spring", [62, 40, 5, 100]),
+        ("summer", [56, 35, 5, 100]),
+        ("fall", [50, 30, 5, 100]),
+    ],
+)
+def test_tiles_follow_the_vegetation_rules(season, expected):
+    B, D = simulation.BiomeType, simulation.DietType
+    species = [
+        make_species("Fern", D.PRODUCER, B.FOREST, 6000),
+        make_species("Moss", D.PRODUCER, B.FOREST, 0),  # Extinct: counts as a producer but isn't shown
+        make_species("Deer", D.HERBIVORE, B.FOREST, 500),
+        make_species("Goat", D.HERBIVORE, B.GRASSLAND, 2000),
+        make_species("Hawk", D.CARNIVORE, B.GRASSLAND, 10),
+        make_species("Reed", D.PRODUCER, B.WETLAND, 20000),
+    ]
+    tiles = [
+        simulation.Tile(x=0, y=y, biome=biome, elevation=10, water_level=50, vegetation=veg)
+        for y, (biome, veg) in enumerate([(B.FOREST, 80), (B.GRASSLAND, 50), (B.DESERT, 3), (B.WETLAND, 10)])
+    ]
+
+    updated = simulation.update_tiles_from_state(tiles, species, season)
+
+    assert [tile.vegetation for tile in updated] == expected
+    assert [tile.species_present for tile in updated] == [["Fern", "Deer"], ["Goat", "Hawk"], [], ["Reed"]]
+    assert [(tile.x, tile.y, tile.biome) for tile in updated] == [(t.x, t.y, t.biome) for t in tiles]
@@ -0,0 +1,106 @@
+"""Tests for streamed simulation turns."""
+
+import asyncio
+
+import pytest
+
+import simulation
+from test_simulation import make_delta
+
+
+def collect(state):
+    async def run():
+        return [item async for item in simulation.stream_advance_simulation(state)]
+
+    return asyncio.run(run())
+
+
+@pytest.mark.parametrize(
+    ("buffer", "expected"),
+    [
+        ('{"season": "summer", ', None),
+        ('{"narration": "', ""),
+        ('{"narration": "The rains', "The rains"),
+        ('{"narration": "A \\"wet', 'A "wet'),
+        ('{"narration": "Line\\', "Line"),  # Escape cut off mid-stream
+        ('{"narration": "Caf\\u00', "Caf"),
+        ('{"narration": "Done.", "warnings": []}', "Done."),
+    ],
+)
+def test_partial_json_string(buffer, expected):
+    assert simulation.partial_json_string(buffer, "narration") == expected
+
+
+def test_stream_yields_narration_then_result(fake_gemini):
+    state = simulation.create_initial_ecosystem(4)
+    text = make_delta(state, narration="Rain fell on the island.").model_dump_json()
+
+    async def stream_handler(model, contents, config):
+        for i in range(0, len(text), 7):
+            yield text[i:i + 7]
+
+    fake_gemini.stream_handler = stream_handler
+    items = collect(state)
+
+    assert "".join(items[:-1]) == "Rain fell on the island."
+    assert items[-1] == simulation.apply_simulation_delta(state, make_delta(state, narration="Rain fell on the island."))
+
+
+def test_failed_stream_before_narration_retries_buffered(fake_gemini):
+    state = simulation.create_initial_ecosystem(4)
+
+    async def stream_handler(model, contents, config):
+        yield '{"populations": ['
+        raise RuntimeError("connection reset")
+
+    async def handler(model, contents, config):
+        return make_delta(state).model_dump_json()
+
+    fake_gemini.stream_handler = stream_handler
+    fake_gemini.handler = handler
+    items = collect(state)
+
+    assert items[0] == "Things grew."
+    assert isinstance(items[-1], simulation.SimulationResult)
+    assert len(fake_gemini.calls) == 1
+
+
+def test_failed_stream_after_narration_is_not_retried(fake_gemini):
+    state = simulation.create_initial_ecosystem(4)
+
+    async def stream_handler(model, contents, config):
+        yield '{"narration": "Half a sto'
+        raise RuntimeError("connection reset")
+
+    fake_gemini.stream_handler = stream_handler
+    with pytest.raises(RuntimeError):
+        collect(state)
+    assert not fake_gemini.calls
+
+
+def collect_chat(state):
+    async def run():
+        return [item async for item in simulation.stream_chat_about_ecosystem(state, "hello")]
+
+    return asyncio.run(run())
+
+
+def test_failed_chat_stream_before_any_text_sends_the_fallback(fake_gemini):
+    async def stream_handler(model, contents, config):
+        raise RuntimeError("connection reset")
+        yield  # pragma: no cover - makes this an async generator
+
+    fake_gemini.stream_handler = stream_handler
+    assert collect_chat(simulation.create_initial_ecosystem(4)) == [simulation.CHAT_FALLBACK]
+
+
+def test_failed_chat_stream_mid_reply_ends_cleanly_and_is_not_cached(fake_gemini):
+    state = simulation.create_initial_ecosystem(4)
+
+    async def stream_handler(model, contents, config):
+        yield "The forest is "
+        raise RuntimeError("connection reset")
+
+    fake_gemini.stream_handler = stream_handler
+    assert collect_chat(state) == ["The forest is "]
+    assert simulation.chat_cache_key(state, "hello") not in simulation.response_cache
@@ -3,16 +3,21 @@ import type { EcosystemState, SimulationResult, InterventionRequest } from './ty
 // Use environment variable for API URL, fallback to localhost for development
 const API_BASE = import.meta.env.VITE_API_URL || 'http://localhost:8000';
 
+// Each tab gets its own ecosystem on the server (randomUUID needs a secure context)
+const SESSION_ID = crypto.randomUUID?.() ?? Math.random().toString(36).slice(2);
+const SESSION_HEADERS = { 'X-Session-ID': SESSION_ID };
+
 export async function createEcosystem(gridSize: number = 8): Promise<EcosystemState> {
   const response = await fetch(`${API_BASE}/ecosystem/new?grid_size=${gridSize}`, {
     method: 'POST',
+    headers: SESSION_HEADERS,
   });
   if (!response.ok) throw new Error('Failed to create ecosystem');
   return response.json();
 }
 
 export async function getEcosystem(): Promise<EcosystemState> {
-  const response = await fetch(`${API_BASE}/ecosystem`);
+  const response = await fetch(`${API_BASE}/ecosystem`, { headers: SESSION_HEADERS });
   if (!response.ok) throw new Error('Failed to get ecosystem');
   return response.json();
 }
@@ -20,7 +25,7 @@ export async function getEcosystem(): Promise<EcosystemState> {
 export async function advanceTurn(intervention?: InterventionRequest): Promise<SimulationResult> {
   const response = await fetch(`${API_BASE}/ecosystem/advance`, {
     method: 'POST',
-    headers: { 'Content-Type': 'application/json' },
+    headers: { ...SESSION_HEADERS, 'Content-Type': 'application/json' },
     body: intervention ? JSON.stringify(intervention) : undefined,
   });
   if (!response.ok) throw new Error('Failed to advance turn');
@@ -30,7 +35,7 @@ export async function advanceTurn(intervention?: InterventionRequest): Promise<S
 export async function chatAboutEcosystem(message: string): Promise<string> {
   const response = await fetch(`${API_BASE}/ecosystem/chat`, {
     method: 'POST',
-    headers: { 'Content-Type': 'application/json' },
+    headers: { ...SESSION_HEADERS, 'Content-Type': 'application/json' },
     body: JSON.stringify({ message }),
   });
   if (!response.ok) throw new Error('Failed to chat');
@@ -41,7 +46,7 @@ export async function chatAboutEcosystem(message: string): Promise<string> {
 export async function loadEcosystem(state: EcosystemState): Promise<EcosystemState> {
   const response = await fetch(`${API_BASE}/ecosystem/load`, {
     method: 'POST',
-    headers: { 'Content-Type': 'application/json' },
+    headers: { ...SESSION_HEADERS, 'Content-Type': 'application/json' },
     body: JSON.stringify(state),
   });
   if (!response.ok) {
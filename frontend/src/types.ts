@@ -55,6 +55,7 @@ export interface SimulationResult {
 export interface InterventionRequest {
   action: string;
   details?: string;
+  thinking_level?: 'minimal' | 'low' | 'medium' | 'high';
 }
 
 // Biome colors for 3D rendering